@@ -2,12 +2,21 @@
 # config/settings.py
 
 import os
+import functools
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_FILE = os.path.join(SCRIPT_DIR, ".env")
-load_dotenv(ENV_FILE)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_env():
+    # Parse .env once per process; real environment variables take precedence
+    load_dotenv(ENV_FILE, override=False)
+
+
+_load_env()
 
 # NVIDIA API Configuration
 NVIDIA_API_URL = "https://ai.api.nvidia.com/v1/cv/nvidia/visual-changenet"
@@ -28,7 +37,14 @@ GEOJSON_PATH = os.path.join(SCRIPT_DIR, "data", "mula_mutha_geojson.json")
 
 # Image configuration
 IMAGE_SIZE = 416  # Model requires 416x416x3 images
+JPEG_QUALITY = 95  # Quality used when writing the model input JPEGs
+USE_CUDA_RESIZE = False  # Resize on the GPU via cv2.cuda when available (batch runs)
 CLOUD_COVER_THRESHOLD = 20  # Maximum cloud cover percentage (0-100)
+SEARCH_CACHE_TTL = 24 * 60 * 60  # Seconds to reuse cached CMR search results
+SEARCH_RETRIES = 3  # Extra attempts for failed CMR searches (exponential backoff)
+MIN_AOI_COVERAGE = 0.9  # Minimum fraction of the AOI a granule footprint must cover
+HTTP_POOL_SIZE = 16  # Keep-alive connections per host for Earthdata downloads
+SAVE_STACKED_GEOTIFF = False  # Also write the clipped B04/B03/B02 stack as a GeoTIFF (debugging)
 
 # Image enhancement (improves contrast/saturation for hazy scenes)
 ENABLE_IMAGE_ENHANCEMENT = True
@@ -42,6 +58,7 @@ GAMMA = 1.0
 # Encroachment decision thresholds
 AREA_THRESHOLD_PIXELS = 500
 CHANGE_RATIO_THRESHOLD = 0.02
+ANALYSIS_DOWNSCALE = 2  # Analyze the change map at 1/N resolution (1 = full resolution)
 
 # Change classes that indicate encroachment
 ENCROACHMENT_CLASSES = {
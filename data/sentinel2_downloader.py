@@ -4,17 +4,34 @@ Downloads cloud-free images using Earthdata credentials
 """
 
 import os
+import re
 import json
+import functools
+import math
+import time
+import hashlib
+import threading
+import contextlib
 import numpy as np
 import cv2
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlparse
 import earthaccess
+from earthaccess.results import DataGranule
+import rasterio
+from rasterio.windows import from_bounds
 import xarray as xr
 import rioxarray as rxr
 import geopandas as gpd
+from shapely.geometry import Polygon, box, shape
+from requests.adapters import HTTPAdapter
 
 from config.settings import (
+    IMAGE_SIZE,
+    JPEG_QUALITY,
+    USE_CUDA_RESIZE,
     ENABLE_IMAGE_ENHANCEMENT,
     PERCENTILE_LOW,
     PERCENTILE_HIGH,
@@ -22,13 +39,257 @@ from config.settings import (
     CLAHE_TILE_GRID_SIZE,
     SATURATION_BOOST,
     GAMMA,
+    SEARCH_CACHE_TTL,
+    SEARCH_RETRIES,
+    MIN_AOI_COVERAGE,
+    HTTP_POOL_SIZE,
+    SAVE_STACKED_GEOTIFF,
 )
 
+# On-disk cache for CMR search results, shared across runs (used when the
+# downloader has no output directory of its own; see _search_cache_dir).
+# Per user and private (0o700), never the world-writable temp dir
+SEARCH_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "river_enc", "cmr_search")
+# Cached searches older than this are never reused, whatever SEARCH_CACHE_TTL says
+_MAX_SEARCH_CACHE_AGE = 7 * 24 * 60 * 60
+
+# Shared PCG64 generator for synthetic-image noise
+_RNG = np.random.default_rng()
+
+_TIF_EXTS = ('.tif', '.tiff')
+# Matches HLS RGB band files, e.g. HLS.S30.T43QCV.2024034T053019.v2.0.B02.tif
+BAND_RE = re.compile(r'\.(B0[234])\.tif$', re.IGNORECASE)
+
+# UMM additional attributes that carry a granule's cloud cover percentage
+_CLOUD_KEYS = ('CLOUD_COVERAGE', 'CLOUD_COVER')
+
+
+def _rgb_band(path):
+    """Return 'B02'/'B03'/'B04' for an HLS RGB band file path or URL path, else None."""
+    match = BAND_RE.search(os.path.basename(path))
+    return match.group(1).upper() if match else None
+
+
+def _band_sizes(granule):
+    """Return {'B02'/'B03'/'B04': size in bytes} for the RGB band files whose size the UMM reports."""
+    info = granule.get('umm', {}).get('DataGranule', {}).get('ArchiveAndDistributionInformation', ())
+    sizes = {}
+    for entry in info:
+        band = _rgb_band(entry.get('Name', ''))
+        if band and entry.get('SizeInBytes') is not None:
+            sizes[band] = int(entry['SizeInBytes'])
+    return sizes
+
+
+def _cloud_cover(granule):
+    """Return a granule's cloud cover percentage, or infinity when not reported."""
+    umm = granule.get('umm', {})
+    if umm.get('CloudCover') is not None:
+        return float(umm['CloudCover'])
+    for attr in umm.get('AdditionalAttributes', ()):
+        values = attr.get('Values')
+        if attr.get('Name') in _CLOUD_KEYS and values:
+            try:
+                return float(values[0])
+            except (TypeError, ValueError):
+                break
+    return math.inf
+
+
+def _overview_level(path, bounds):
+    """
+    Pick the coarsest COG overview that still resolves the AOI at IMAGE_SIZE pixels
+    
+    Args:
+        path: Raster file path
+        bounds: AOI bounds (minx, miny, maxx, maxy) in the raster CRS
+    
+    Returns:
+        Overview level index for rioxarray, or None to read full resolution
+    """
+    with rasterio.open(path) as src:
+        window = from_bounds(*bounds, transform=src.transform)
+        span = min(window.width, window.height)
+        level = None
+        for i, factor in enumerate(src.overviews(1)):
+            if span / factor >= IMAGE_SIZE:
+                level = i
+        return level
+
+
+def _cuda_device_available():
+    """Return True when OpenCV was built with CUDA and a device is present."""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+_USE_CUDA = USE_CUDA_RESIZE and _cuda_device_available()
+
+
+def _resize_to_model_input(img):
+    """Resize to IMAGE_SIZE x IMAGE_SIZE, on the GPU when enabled and available."""
+    size = (IMAGE_SIZE, IMAGE_SIZE)
+    if _USE_CUDA:
+        try:
+            gpu_img = cv2.cuda_GpuMat()
+            gpu_img.upload(img)
+            return cv2.cuda.resize(gpu_img, size, interpolation=cv2.INTER_AREA).download()
+        except cv2.error:
+            pass  # e.g. INTER_AREA upscaling is CPU-only; fall through
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+# GDAL options for band reads; entered per thread (rasterio.Env is thread-local)
+_GDAL_ENV_OPTIONS = {'GDAL_NUM_THREADS': 'ALL_CPUS', 'GDAL_CACHEMAX': 512}
+
+# Guards the per-directory download manifest shared by the before/after workers
+# within a process; _manifest_lock adds an OS file lock across processes
+_MANIFEST_LOCK = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+@contextlib.contextmanager
+def _manifest_lock(manifest_path):
+    """Hold the download manifest exclusively, across threads and processes."""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with _MANIFEST_LOCK, open(f"{manifest_path}.lock", 'a+b') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Earthdata logins are process-wide; reuse them across downloader instances
+_LOGIN_LOCK = threading.Lock()
+_LOGINS = {}
+
+
+def _earthdata_login():
+    """Log in to Earthdata once per process (per username) and reuse the session."""
+    username = os.environ.get('EARTHDATA_USERNAME')
+    with _LOGIN_LOCK:
+        auth = _LOGINS.get(username)
+        if auth is None or not getattr(auth, 'authenticated', False):
+            auth = earthaccess.login(strategy='environment', persist=False)
+            _LOGINS[username] = auth
+        return auth
+
+
+def _pooled_https_session():
+    """
+    Return earthaccess' authenticated HTTPS session with a keep-alive connection pool
+    
+    The adapter is mounted once per process so band GETs to LP DAAC (made by
+    Sentinel2Downloader._fetch_links) reuse warm TLS connections instead of
+    handshaking per file.
+    
+    Returns:
+        requests.Session used by earthaccess for HTTPS downloads
+    """
+    session = earthaccess.get_requests_https_session()
+    with _LOGIN_LOCK:
+        if not getattr(session, '_pooled', False):
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=3)
+            session.mount('https://', adapter)
+            session.headers.pop('Connection', None)
+            session._pooled = True
+    return session
+
+
+def _acquisition_time(granule):
+    """Return a granule's (naive UTC) acquisition start time, or None."""
+    value = (
+        granule.get('umm', {})
+        .get('TemporalExtent', {})
+        .get('RangeDateTime', {})
+        .get('BeginningDateTime')
+    )
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _granules_near(granules, target_date, days):
+    """Return the granules acquired within ±days of target_date."""
+    window = timedelta(days=days)
+    nearby = []
+    for granule in granules:
+        acquired = _acquisition_time(granule)
+        if acquired is not None and abs(acquired - target_date) <= window:
+            nearby.append(granule)
+    return nearby
+
+
+def _granule_footprint(granule):
+    """Return a granule's footprint polygon from its UMM spatial extent, or None."""
+    geometry = (
+        granule.get('umm', {})
+        .get('SpatialExtent', {})
+        .get('HorizontalSpatialDomain', {})
+        .get('Geometry', {})
+    )
+    for gpolygon in geometry.get('GPolygons', ()):
+        points = gpolygon.get('Boundary', {}).get('Points', ())
+        if len(points) >= 3:
+            return Polygon([(p['Longitude'], p['Latitude']) for p in points])
+    for rect in geometry.get('BoundingRectangles', ()):
+        return box(
+            rect['WestBoundingCoordinate'], rect['SouthBoundingCoordinate'],
+            rect['EastBoundingCoordinate'], rect['NorthBoundingCoordinate'],
+        )
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _synthetic_pattern():
+    """
+    Return the deterministic (noise-free) float32 pattern behind synthetic images
+    
+    Channel c is base[c] + amplitude[c] * sin(x + phase[c]) * cos(y + phase[c]),
+    with rows following y and columns following x. Computed once and reused by
+    every synthetic fallback (before and after often both need one).
+    """
+    base = np.array([100, 120, 80], dtype=np.float32)
+    amplitude = np.array([50, 60, 40], dtype=np.float32)
+    phase = np.array([0.0, 0.5, 1.0], dtype=np.float32)
+    angles = np.linspace(0, 4, 416, dtype=np.float32)[:, None] + phase
+    # Broadcast the (416, 3) row/column factors into the interleaved buffer in one kernel
+    pattern = np.cos(angles)[:, None, :] * (amplitude * np.sin(angles))[None, :, :]
+    pattern += base
+    pattern.setflags(write=False)
+    return pattern
+
+
+def _search_and_download_worker(downloader, *args):
+    """Process-pool entry point: log this process in, then run one date."""
+    if _earthdata_login():
+        downloader._session = _pooled_https_session()
+    return downloader._search_and_download(*args)
+
 
 class Sentinel2Downloader:
     """Download and process Sentinel-2 images using earthaccess API"""
     
-    def __init__(self, username=None, password=None, geojson_path=None, token=None, zoom_factor=1.0):
+    def __init__(self, username=None, password=None, geojson_path=None, token=None, zoom_factor=1.0,
+                 output_dir=None):
         """
         Initialize downloader with Earthdata credentials
         
@@ -37,9 +298,15 @@ class Sentinel2Downloader:
             password: Earthdata password
             geojson_path: Path to GeoJSON file with area of interest
             token: Optional token (not used; kept for compatibility)
+            output_dir: Default directory for downloaded images (created once here)
         """
         self.username = username
         self.password = password
+        self._session = None
+        
+        self.output_dir = Path(output_dir) if output_dir else None
+        if self.output_dir:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
         
         # Set environment variables for earthaccess
         if username and password:
@@ -49,18 +316,19 @@ class Sentinel2Downloader:
         # Login to earthaccess
         print(f"[+] Authenticating with Earthdata...")
         try:
-            session = earthaccess.login(strategy='environment', persist=False)
+            session = _earthdata_login()
             if session:
                 print(f"[+] Earthdata authentication successful")
+                self._session = _pooled_https_session()
             else:
                 print(f"[!] Warning: Earthdata login failed")
         except Exception as e:
             print(f"[!] Warning: Earthdata login failed: {e}")
         
-        # Handle geojson path
-        if not os.path.isabs(geojson_path):
-            script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            geojson_path = os.path.join(script_dir, geojson_path)
+        # Handle geojson path (relative paths are resolved against the project root)
+        geojson_path = Path(geojson_path)
+        if not geojson_path.is_absolute():
+            geojson_path = Path(__file__).resolve().parent.parent / geojson_path
         
         # Load GeoJSON
         with open(geojson_path, 'r') as f:
@@ -75,89 +343,166 @@ class Sentinel2Downloader:
         # Factor to expand the GeoJSON bounding box (1.0 = no change)
         self.zoom_factor = float(zoom_factor) if zoom_factor else 1.0
 
+        # CMR search cache lives next to the outputs so re-runs on the same AOI reuse it
+        self._search_cache_dir = self.output_dir / '.cmr_cache' if self.output_dir else Path(SEARCH_CACHE_DIR)
+
         self.bounds = self._extract_bounds()
+        self.aoi = shape(self.geojson['features'][0]['geometry'])
+
+        # The clipped multi-band GeoTIFF is never read back; only write it for debugging
+        self.save_stacked_geotiff = SAVE_STACKED_GEOTIFF
+
+        # AOI reprojected per raster CRS (HLS tiles of one AOI share a UTM zone)
+        self._field_by_crs = {}
+
+        # Per-thread cache for reusable OpenCV objects and buffers (see _get_clahe)
+        self._thread_local = threading.local()
+
+        # Enhancement constants, computed once instead of on every _enhance_bgr call
+        self._ramp = np.arange(256, dtype=np.float32)[:, None]
+        self._inv_gamma = 1.0 / GAMMA if GAMMA else 1.0
+        self._sat_lut = np.clip(np.arange(256, dtype=np.float32) * SATURATION_BOOST, 0, 255).astype(np.uint8)
+
+    def __getstate__(self):
+        # Thread-local OpenCV state and the HTTP session stay with the parent
+        # process; _search_and_download_worker sets up the child's own session
+        state = self.__dict__.copy()
+        state['_thread_local'] = None
+        state['_session'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._thread_local = threading.local()
 
     def _normalize_to_uint8(self, img):
         """Normalize a float/uint image to uint8 using min/max scaling."""
-        img_min, img_max = img.min(), img.max()
-        if img_max > img_min:
-            img = (img - img_min) / (img_max - img_min)
-        img = np.clip(img, 0, 1)
-        return (img * 255.0).astype(np.uint8)
+        # Keep the native (e.g. int16) dtype: one min/max pass, then a fused
+        # scale + saturate-to-uint8 kernel with no float intermediate
+        mn = float(np.nanmin(img))
+        mx = float(np.nanmax(img))
+        scale = 255.0 / max(mx - mn, 1e-9)
+        return cv2.convertScaleAbs(img, alpha=scale, beta=-mn * scale)
+
+    def _save_image(self, img, output_dir, filename):
+        """Resize to the model input size and encode straight to the output file."""
+        if img.shape[:2] != (IMAGE_SIZE, IMAGE_SIZE):
+            img = _resize_to_model_input(img)
+        output_path = os.path.join(output_dir, filename)
+        cv2.imwrite(output_path, img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return output_path
+
+    def _get_clahe(self):
+        """Return this thread's CLAHE instance (apply() is not safe to share across threads)."""
+        clahe = getattr(self._thread_local, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(
+                clipLimit=CLAHE_CLIP_LIMIT,
+                tileGridSize=(CLAHE_TILE_GRID_SIZE, CLAHE_TILE_GRID_SIZE),
+            )
+            self._thread_local.clahe = clahe
+        return clahe
 
     def _enhance_bgr(self, bgr):
         """Enhance contrast and saturation for hazy/washed imagery."""
         if not ENABLE_IMAGE_ENHANCEMENT:
             return bgr
 
-        # Percentile stretch per channel
-        stretched = bgr.astype(np.float32)
-        for c in range(3):
-            low = np.percentile(stretched[:, :, c], PERCENTILE_LOW)
-            high = np.percentile(stretched[:, :, c], PERCENTILE_HIGH)
-            if high > low:
-                stretched[:, :, c] = (stretched[:, :, c] - low) / (high - low)
-        stretched = np.clip(stretched, 0, 1)
-
-        if GAMMA and GAMMA != 1.0:
-            stretched = np.power(stretched, 1.0 / GAMMA)
+        # Percentile stretch + gamma fused into one per-channel uint8 -> uint8 table,
+        # applied in a single cv2.LUT pass (flat channels are left unscaled)
+        low, high = np.percentile(bgr.reshape(-1, 3), (PERCENTILE_LOW, PERCENTILE_HIGH), axis=0)
+        valid = high > low
+        offset = np.where(valid, low, 0.0).astype(np.float32)
+        scale = np.where(valid, 1.0 / np.where(valid, high - low, 1.0), 1.0).astype(np.float32)
+        lut = (self._ramp - offset) * scale
+        np.clip(lut, 0, 1, out=lut)
+        if self._inv_gamma != 1.0:
+            np.power(lut, self._inv_gamma, out=lut)
+        lut = (lut * 255.0).astype(np.uint8)
+        enhanced = cv2.LUT(bgr, lut.reshape(256, 1, 3))
 
-        enhanced = (stretched * 255.0).astype(np.uint8)
-
-        # CLAHE on luminance channel (LAB)
+        # CLAHE on luminance channel (LAB); only L is pulled out and written back
         if CLAHE_CLIP_LIMIT and CLAHE_CLIP_LIMIT > 0:
-            lab = cv2.cvtColor(enhanced, cv2.COLOR_BGR2LAB)
-            l, a, b = cv2.split(lab)
-            clahe = cv2.createCLAHE(
-                clipLimit=CLAHE_CLIP_LIMIT,
-                tileGridSize=(CLAHE_TILE_GRID_SIZE, CLAHE_TILE_GRID_SIZE),
-            )
-            l = clahe.apply(l)
-            lab = cv2.merge([l, a, b])
+            # The LAB buffer is per thread (before/after enhance concurrently) and is
+            # reused across calls of the same size
+            lab = cv2.cvtColor(enhanced, cv2.COLOR_BGR2LAB, dst=getattr(self._thread_local, 'lab', None))
+            self._thread_local.lab = lab
+            l = self._get_clahe().apply(cv2.extractChannel(lab, 0))
+            cv2.insertChannel(l, lab, 0)
             enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
 
-        # Boost saturation (HSV)
+        # Boost saturation (HSV) with a lookup on the S channel only
         if SATURATION_BOOST and SATURATION_BOOST != 1.0:
-            hsv = cv2.cvtColor(enhanced, cv2.COLOR_BGR2HSV).astype(np.float32)
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * SATURATION_BOOST, 0, 255)
-            enhanced = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+            h, sat, v = cv2.split(cv2.cvtColor(enhanced, cv2.COLOR_BGR2HSV))
+            sat = cv2.LUT(sat, self._sat_lut)
+            enhanced = cv2.cvtColor(cv2.merge([h, sat, v]), cv2.COLOR_HSV2BGR)
 
         return enhanced
     
+    def _field_in_crs(self, crs):
+        """Return the AOI GeoDataFrame in the given CRS, reprojecting once per CRS."""
+        key = str(crs)
+        field = self._field_by_crs.get(key)
+        if field is None:
+            field = self.field if self.field.crs == crs else self.field.to_crs(crs)
+            self._field_by_crs[key] = field
+        return field
+    
     def _extract_bounds(self):
         """Extract bounding box from GeoJSON"""
         feature = self.geojson['features'][0]
+        
+        # Prefer a precomputed GeoJSON bbox member: [west, south, (zmin,) east, north, (zmax)]
+        bbox = feature.get('bbox') or self.geojson.get('bbox')
+        if bbox and len(bbox) >= 4:
+            half = len(bbox) // 2
+            return {
+                'min_lon': float(bbox[0]),
+                'max_lon': float(bbox[half]),
+                'min_lat': float(bbox[1]),
+                'max_lat': float(bbox[half + 1])
+            }
+        
         geometry = feature['geometry']
         
+        # Holes lie inside their exterior ring, so only exterior rings bound the shape
         if geometry['type'] == 'Polygon':
-            coords = geometry['coordinates'][0]
+            rings = geometry['coordinates'][:1]
         elif geometry['type'] == 'MultiPolygon':
-            coords = geometry['coordinates'][0][0]
+            rings = [polygon[0] for polygon in geometry['coordinates']]
         else:
-            coords = geometry['coordinates']
+            rings = [geometry['coordinates']]
         
-        lons = [float(c[0]) for c in coords]
-        lats = [float(c[1]) for c in coords]
+        # Single vectorized min/max pass over every vertex
+        pts = np.concatenate([np.asarray(ring, dtype=np.float64)[:, :2] for ring in rings])
+        mn = pts.min(axis=0)
+        mx = pts.max(axis=0)
         
         return {
-            'min_lon': min(lons),
-            'max_lon': max(lons),
-            'min_lat': min(lats),
-            'max_lat': max(lats)
+            'min_lon': float(mn[0]),
+            'max_lon': float(mx[0]),
+            'min_lat': float(mn[1]),
+            'max_lat': float(mx[1])
         }
     
-    def download_images(self, output_dir, current_date=None, cloud_threshold=20):
+    def download_images(self, output_dir=None, current_date=None, cloud_threshold=20):
         """
         Download before and after Sentinel-2 images
         
         Args:
-            output_dir: Directory to save images
+            output_dir: Directory to save images (defaults to the one given at init)
             current_date: Current date (datetime), defaults to today
             cloud_threshold: Maximum cloud cover percentage (0-100)
         
         Returns:
             Tuple of (before_image_path, after_image_path)
+        
+        Raises:
+            ValueError: If no output directory was given here or at init
         """
+        if output_dir is None and self.output_dir is None:
+            raise ValueError("download_images() needs an output_dir (none was given here or at init)")
+        
         # Use 2024 and 2025 as before and after dates
         before_date = datetime(2024, 2, 3)
         after_date = datetime(2025, 2, 3)
@@ -168,34 +513,66 @@ class Sentinel2Downloader:
         print(f"Area bounds: {self.bounds}")
         print(f"Max cloud cover: {cloud_threshold}%")
         
-        os.makedirs(output_dir, exist_ok=True)
+        if output_dir is None:
+            output_dir = self.output_dir
+        elif Path(output_dir) != self.output_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
-        before_path = self._search_and_download(
-            before_date, output_dir, "before.jpg", cloud_threshold
-        )
-        after_path = self._search_and_download(
-            after_date, output_dir, "after.jpg", cloud_threshold
-        )
+        # One bounded CMR query per date covers its widest (±45 day) window;
+        # each date then picks its candidates locally
+        bbox = self._search_bbox()
+        windows = [
+            (
+                (target - timedelta(days=45)).strftime('%Y-%m-%d'),
+                (target + timedelta(days=45)).strftime('%Y-%m-%d'),
+            )
+            for target in (before_date, after_date)
+        ]
         
-        return before_path, after_path
-    
-    def _search_and_download(self, target_date, output_dir, filename, cloud_threshold):
-        """
-        Search for and download a Sentinel-2 image
+        print(f"\nSearching for images...")
+        print(f"  Search windows: {windows}")
+        print(f"  Bounding box: {bbox}")
         
-        Args:
-            target_date: Target date for image
-            output_dir: Output directory
-            filename: Output filename
-            cloud_threshold: Maximum cloud cover percentage
+        window_results = []
+        for window in windows:
+            try:
+                # Search using short_name like the notebook (searches HLSL30 and HLSS30)
+                # This searches across both Landsat and Sentinel-2 HLS datasets
+                print(f"  Querying CMR for HLS data (HLSL30, HLSS30) in {window[0]} .. {window[1]}...")
+                results = self._search_granules(
+                    window,
+                    short_name=['HLSL30', 'HLSS30'],
+                    bounding_box=bbox,
+                )
+                print(f"  Found {len(results)} images")
+            except Exception as e:
+                print(f"Search error: {e}")
+                import traceback
+                traceback.print_exc()
+                results = []
+            window_results.append(results)
+        before_results, after_results = window_results
         
-        Returns:
-            Path to downloaded and processed image
-        """
-        # Use wider search window (±30 days) for better coverage
-        start_date = (target_date - timedelta(days=30)).strftime('%Y-%m-%d')
-        end_date = (target_date + timedelta(days=30)).strftime('%Y-%m-%d')
+        # The two dates share nothing mutable, so run them in separate processes
+        # (download, decode and enhancement fully overlap). Entry scripts must be
+        # guarded by `if __name__ == "__main__"` for spawn/forkserver workers.
+        # Fall back to running them one after the other if the pool can't be used
+        jobs = [
+            (before_date, output_dir, "before.jpg", cloud_threshold, before_results),
+            (after_date, output_dir, "after.jpg", cloud_threshold, after_results),
+        ]
+        try:
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(_search_and_download_worker, self, *job) for job in jobs]
+                before_path, after_path = [future.result() for future in futures]
+        except Exception as e:
+            print(f"Process pool unavailable ({e}); processing dates sequentially...")
+            before_path, after_path = [self._search_and_download(*job) for job in jobs]
         
+        return before_path, after_path
+    
+    def _search_bbox(self):
+        """Return the AOI bounding box expanded by zoom_factor, as (W, S, E, N)."""
         # Expand bounding box by zoom_factor around its center
         min_lon = float(self.bounds['min_lon'])
         max_lon = float(self.bounds['max_lon'])
@@ -214,37 +591,154 @@ class Sentinel2Downloader:
         bbox_min_lat = max(-90.0, center_lat - half_height)
         bbox_max_lat = min(90.0, center_lat + half_height)
 
-        bbox = (bbox_min_lon, bbox_min_lat, bbox_max_lon, bbox_max_lat)
+        return (bbox_min_lon, bbox_min_lat, bbox_max_lon, bbox_max_lat)
+    
+    def _search_granules(self, window, **query):
+        """
+        Search CMR over one date window, reusing cached results for identical queries
         
-        print(f"\nSearching for image near {target_date.strftime('%Y-%m-%d')}...")
-        print(f"  Search window: {start_date} to {end_date}")
-        print(f"  Bounding box: {bbox}")
+        Every page of the result set is fetched, so a busy window is never truncated.
+        
+        Args:
+            window: (start_date, end_date) range to search
+            **query: Other DataGranules parameters (short_name, bounding_box, ...)
+        
+        Returns:
+            List of matching granules
+        """
+        # Round the bbox so float noise from zoom/bounds math doesn't miss the cache
+        key_query = {
+            name: tuple(round(v, 4) for v in value) if name == 'bounding_box' else value
+            for name, value in query.items()
+        }
+        key = repr((tuple(window), sorted(key_query.items())))
+        cache_path = self._search_cache_dir / f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.json"
+        ttl = min(SEARCH_CACHE_TTL, _MAX_SEARCH_CACHE_AGE)
         
+        # Cached as plain UMM JSON (DataGranule is a dict) and rebuilt on load;
+        # never unpickled, so a planted cache file can't execute code
         try:
-            # Search using short_name like the notebook (searches HLSL30 and HLSS30)
-            # This searches across both Landsat and Sentinel-2 HLS datasets
-            print(f"  Querying CMR for HLS data (HLSL30, HLSS30)...")
-            results = earthaccess.search_data(
-                short_name=['HLSL30', 'HLSS30'],
-                temporal=(start_date, end_date),
-                bounding_box=bbox,
-                count=30
-            )
+            if time.time() - os.path.getmtime(cache_path) < ttl:
+                with open(cache_path, 'r') as f:
+                    cached = json.load(f)
+                results = [
+                    DataGranule(entry['granule'], cloud_hosted=entry['cloud_hosted'])
+                    for entry in cached
+                ]
+                print(f"  Using cached search results ({len(results)} granules)")
+                return results
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        
+        # Retry transient CMR failures (e.g. 503s) with exponential backoff
+        for attempt in range(SEARCH_RETRIES + 1):
+            try:
+                granule_query = earthaccess.DataGranules().parameters(**query).temporal(*window)
+                hits = granule_query.hits()
+                results = granule_query.get(hits) if hits else []
+                break
+            except Exception as e:
+                if attempt == SEARCH_RETRIES:
+                    raise
+                delay = 2 ** attempt
+                print(f"  Search failed ({e}); retrying in {delay}s...")
+                time.sleep(delay)
+        if not results:
+            return results
+        
+        try:
+            self._search_cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            cached = [
+                {'granule': dict(granule), 'cloud_hosted': getattr(granule, 'cloud_hosted', False)}
+                for granule in results
+            ]
+            with open(cache_path, 'w') as f:
+                json.dump(cached, f)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"  Could not cache search results: {e}")
+        
+        return results
+    
+    def _rank_granules(self, results):
+        """
+        Drop granules that barely cover the AOI and order the rest by cloud cover
+        
+        If no granule reaches MIN_AOI_COVERAGE, the partially covering ones are
+        returned instead, best coverage first.
+        
+        Args:
+            results: Granules returned by the search
+        
+        Returns:
+            List of granules, clearest first (or best-covering first, see above)
+        """
+        aoi_area = self.aoi.area
+        ranked = []
+        partial = []
+        for granule in results:
+            footprint = _granule_footprint(granule)
+            if footprint is None or aoi_area == 0:
+                coverage = None  # Unknown footprint; let clipping decide later
+            elif not footprint.intersects(self.aoi):
+                coverage = 0.0
+            else:
+                coverage = footprint.intersection(self.aoi).area / aoi_area
+            if coverage is not None and coverage < MIN_AOI_COVERAGE:
+                if coverage > 0:
+                    partial.append((-coverage, _cloud_cover(granule), granule))
+                continue
+            ranked.append((_cloud_cover(granule), -(coverage or 0.0), granule))
+        
+        # An AOI straddling a tile edge may have no well-covering granule at all;
+        # a partial scene beats a synthetic one, so fall back to the best coverage
+        if not ranked and partial:
+            print(f"No image covers {MIN_AOI_COVERAGE:.0%} of the AOI; using the best partial coverage")
+            partial.sort(key=lambda item: item[:2])
+            return [granule for _, _, granule in partial]
+        
+        skipped = len(results) - len(ranked)
+        if skipped:
+            print(f"Skipped {skipped} images covering less than {MIN_AOI_COVERAGE:.0%} of the AOI")
+        
+        ranked.sort(key=lambda item: item[:2])
+        return [granule for _, _, granule in ranked]
+    
+    def _search_and_download(self, target_date, output_dir, filename, cloud_threshold, granules):
+        """
+        Pick and download the best Sentinel-2 image for a date
+        
+        Args:
+            target_date: Target date for image
+            output_dir: Output directory
+            filename: Output filename
+            cloud_threshold: Maximum cloud cover percentage
+            granules: Search results covering at least ±45 days around target_date
+        
+        Returns:
+            Path to downloaded and processed image
+        """
+        print(f"\nSelecting image near {target_date.strftime('%Y-%m-%d')}...")
+        
+        try:
+            # Prefer the ±30 day window for better coverage
+            results = _granules_near(granules, target_date, days=30)
             
             if results:
                 print(f"Found {len(results)} matching images")
                 
+                # Try the clearest well-covering scenes first so the first successful
+                # download is the best one
+                results = self._rank_granules(results)
+                clear = sum(1 for r in results if _cloud_cover(r) <= cloud_threshold)
+                print(f"{clear} images within {cloud_threshold}% cloud cover")
+                
                 # Try to download from results
                 for i, result in enumerate(results):
                     try:
                         print(f"Attempting download {i+1}/{len(results)}...")
                         
                         # Download the granule
-                        files = earthaccess.download(
-                            result,
-                            local_path=os.path.join(output_dir, "_download_tmp"),
-                            threads=4
-                        )
+                        files = self._download_granule(result, output_dir)
                         
                         if files:
                             print(f"Downloaded {len(files)} files, processing...")
@@ -260,27 +754,17 @@ class Sentinel2Downloader:
             # Try with broader date range if first attempt fails
             if not results:
                 print(f"No results in initial window. Trying with ±45 days...")
-                start_date_broad = (target_date - timedelta(days=45)).strftime('%Y-%m-%d')
-                end_date_broad = (target_date + timedelta(days=45)).strftime('%Y-%m-%d')
-                results = earthaccess.search_data(
-                    short_name=['HLSL30', 'HLSS30'],
-                    temporal=(start_date_broad, end_date_broad),
-                    bounding_box=bbox,
-                    count=30
-                )
+                results = _granules_near(granules, target_date, days=45)
                 
                 if results:
                     print(f"Found {len(results)} images (no cloud filter)")
+                    results = self._rank_granules(results)
                     
                     for i, result in enumerate(results[:10]):
                         try:
                             print(f"Attempting download {i+1}/10...")
                             
-                            files = earthaccess.download(
-                                result,
-                                local_path=os.path.join(output_dir, "_download_tmp"),
-                                threads=4
-                            )
+                            files = self._download_granule(result, output_dir)
                             
                             if files:
                                 print(f"Downloaded {len(files)} files, processing...")
@@ -297,12 +781,129 @@ class Sentinel2Downloader:
             return self._create_synthetic_image(output_dir, filename)
             
         except Exception as e:
-            print(f"Search error: {e}")
+            print(f"Download error: {e}")
             import traceback
             traceback.print_exc()
             print("Creating synthetic image for demo...")
             return self._create_synthetic_image(output_dir, filename)
     
+    def _download_granule(self, granule, output_dir):
+        """
+        Download the RGB band files of a granule (or the whole granule as fallback)
+        
+        Args:
+            granule: earthaccess search result
+            output_dir: Output directory
+        
+        Returns:
+            List of downloaded file paths
+        """
+        download_dir = os.path.join(output_dir, "_download_tmp")
+        manifest_path = os.path.join(download_dir, "products.json")
+        product_id = (
+            granule.get('meta', {}).get('native-id')
+            or granule.get('umm', {}).get('GranuleUR')
+        )
+        
+        # Reuse a previous complete download of the same product
+        if product_id:
+            with _manifest_lock(manifest_path):
+                manifest = self._read_manifest(manifest_path)
+            entry = manifest.get(product_id)
+            if entry and all(
+                os.path.exists(path) and os.path.getsize(path) == size
+                for path, size in entry.items()
+            ):
+                print(f"Reusing downloaded product {product_id}")
+                return list(entry)
+        
+        # HLS granules ship ~15 single-band COGs; only B02/B03/B04 are used
+        band_links = [
+            link for link in granule.data_links()
+            if _rgb_band(urlparse(link).path)
+        ]
+        
+        files = None
+        if len(band_links) == 3 and self._session is not None:
+            try:
+                files = self._fetch_links(band_links, download_dir)
+            except Exception as e:
+                print(f"Pooled download failed ({e}); falling back to earthaccess.download")
+        if not files:
+            files = earthaccess.download(
+                band_links if len(band_links) == 3 else granule,
+                local_path=download_dir,
+                threads=8
+            )
+        
+        # Only a complete RGB set is recorded: earthaccess.download can return a
+        # partial list, and a manifest entry is trusted on reuse without re-checking
+        band_files = {_rgb_band(str(f)): str(f) for f in files or ()}
+        band_files.pop(None, None)
+        sizes = {
+            band: os.path.getsize(path) if os.path.exists(path) else 0
+            for band, path in band_files.items()
+        }
+        expected_sizes = _band_sizes(granule)
+        complete = len(sizes) == 3 and all(
+            size > 0 and expected_sizes.get(band, size) == size
+            for band, size in sizes.items()
+        )
+        if product_id and complete:
+            with _manifest_lock(manifest_path):
+                manifest = self._read_manifest(manifest_path)
+                manifest[product_id] = {band_files[band]: size for band, size in sizes.items()}
+                with open(manifest_path, 'w') as f:
+                    json.dump(manifest, f, indent=2)
+        elif product_id and files:
+            print(f"Incomplete download for {product_id} (got {sorted(band_files)}); not recording it")
+        
+        return files
+    
+    def _fetch_links(self, links, download_dir):
+        """
+        Stream band files through the pooled keep-alive session (see _pooled_https_session)
+        
+        earthaccess.download builds its own per-thread sessions, which don't carry
+        our mounted adapter, so the RGB bands are fetched here instead.
+        
+        Args:
+            links: HTTPS URLs of the band files
+            download_dir: Directory to write the files to
+        
+        Returns:
+            List of downloaded file paths
+        """
+        os.makedirs(download_dir, exist_ok=True)
+        
+        def fetch(link):
+            path = os.path.join(download_dir, os.path.basename(urlparse(link).path))
+            part_path = f"{path}.part"
+            with self._session.get(link, stream=True, timeout=300) as response:
+                response.raise_for_status()
+                expected = response.headers.get('Content-Length')
+                if response.headers.get('Content-Encoding'):
+                    expected = None  # iter_content decodes, so sizes won't match
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                    written = f.tell()
+            if expected is not None and written != int(expected):
+                raise IOError(f"Truncated download of {link}: {written} of {expected} bytes")
+            os.replace(part_path, path)
+            return path
+        
+        with ThreadPoolExecutor(max_workers=len(links)) as executor:
+            return list(executor.map(fetch, links))
+    
+    def _read_manifest(self, manifest_path):
+        """Load the product_id -> {path: size} download manifest (empty if missing)."""
+        try:
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
     def _process_downloaded_files(self, files, output_dir, filename):
         """
         Process downloaded files and extract RGB image
@@ -313,8 +914,16 @@ class Sentinel2Downloader:
             filename: Output filename
         
         Returns:
-            Path to processed 416x416 image
+            Path to processed IMAGE_SIZE x IMAGE_SIZE image
         """
+        # Let GDAL decompress COG tiles on all cores. rasterio.Env only applies to
+        # the thread that entered it, so each before/after worker enters its own and
+        # the per-band clip threads (see _extract_rgb_image) enter it again
+        with rasterio.Env(**_GDAL_ENV_OPTIONS):
+            return self._extract_rgb_image(files, output_dir, filename)
+    
+    def _extract_rgb_image(self, files, output_dir, filename):
+        """Build the RGB model input from downloaded band files (see _process_downloaded_files)."""
         import rioxarray as rxr
         
         print(f"Processing {len(files)} downloaded files...")
@@ -333,52 +942,77 @@ class Sentinel2Downloader:
             # These are separate files, so load them and stack
             rgb_bands = {'B02': None, 'B03': None, 'B04': None}
             
+            # Locate each band's file in a single pass
+            band_paths = {}
             for file_path in files:
-                basename = os.path.basename(file_path.upper())
-                for band in rgb_bands.keys():
-                    # Check if this file contains the band
-                    if f'.{band}.' in basename or basename.endswith(f'{band}.TIF'):
-                        try:
-                            print(f"Loading {band} from {os.path.basename(file_path)}...")
-                            data = rxr.open_rasterio(file_path)
-                            rgb_bands[band] = data.values[0]  # Extract first (only) band
-                            print(f"  Shape: {rgb_bands[band].shape}")
-                        except Exception as e:
-                            print(f"Could not load {band}: {e}")
+                band = _rgb_band(file_path)
+                if band:
+                    band_paths[band] = file_path
+            
+            for band, file_path in band_paths.items():
+                try:
+                    print(f"Loading {band} from {os.path.basename(file_path)}...")
+                    # Opened once, lazily; the same DataArray is windowed and clipped below
+                    rgb_bands[band] = rxr.open_rasterio(file_path, lock=False).squeeze()
+                    print(f"  Shape: {rgb_bands[band].shape}")
+                except Exception as e:
+                    print(f"Could not load {band}: {e}")
             
             # Check if we have all RGB bands
             if all(v is not None for v in rgb_bands.values()):
                 print("Creating RGB composite from B02, B03, B04...")
-                # Try to locate the exact file paths for each band so we can save a stacked GeoTIFF
                 da_b02_clipped = None
                 da_b03_clipped = None
                 da_b04_clipped = None
                 try:
-                    b02_path = next(f for f in files if '.B02.' in os.path.basename(f).upper() or os.path.basename(f).upper().endswith('B02.TIF'))
-                    b03_path = next(f for f in files if '.B03.' in os.path.basename(f).upper() or os.path.basename(f).upper().endswith('B03.TIF'))
-                    b04_path = next(f for f in files if '.B04.' in os.path.basename(f).upper() or os.path.basename(f).upper().endswith('B04.TIF'))
+                    b02_path = band_paths['B02']
+                    b03_path = band_paths['B03']
+                    b04_path = band_paths['B04']
 
-                    # Open as DataArrays so we can stack and save as multi-band GeoTIFF
-                    da_b02 = rxr.open_rasterio(b02_path).squeeze()
-                    da_b03 = rxr.open_rasterio(b03_path).squeeze()
-                    da_b04 = rxr.open_rasterio(b04_path).squeeze()
+                    da_b02 = rgb_bands['B02']
+                    da_b03 = rgb_bands['B03']
+                    da_b04 = rgb_bands['B04']
 
                     # Reproject field to match the image CRS if needed
                     common_crs = da_b02.rio.crs
                     if common_crs is None:
                         print("Raster CRS missing; cannot verify AOI. Skipping this granule.")
                         return None
-                    if self.field.crs != common_crs:
-                        field_reprojected = self.field.to_crs(common_crs)
-                    else:
-                        field_reprojected = self.field
+                    field_reprojected = self._field_in_crs(common_crs)
+                    geoms = field_reprojected.geometry.values
 
                     # Clip each band to the field polygon (following notebook pattern)
                     print(f"Clipping bands to polygon geometry...")
                     try:
-                        da_b02_clipped = da_b02.rio.clip(field_reprojected.geometry.values, drop=True, all_touched=True)
-                        da_b03_clipped = da_b03.rio.clip(field_reprojected.geometry.values, drop=True, all_touched=True)
-                        da_b04_clipped = da_b04.rio.clip(field_reprojected.geometry.values, drop=True, all_touched=True)
+                        minx, miny, maxx, maxy = field_reprojected.total_bounds
+
+                        # For AOIs much larger than the model input, read from the COG
+                        # overviews instead of decoding full-resolution tiles
+                        level = _overview_level(b02_path, (minx, miny, maxx, maxy))
+                        if level is not None:
+                            print(f"Reading overview level {level} for large AOI")
+                            da_b02 = rxr.open_rasterio(b02_path, overview_level=level, lock=False).squeeze()
+                            da_b03 = rxr.open_rasterio(b03_path, overview_level=level, lock=False).squeeze()
+                            da_b04 = rxr.open_rasterio(b04_path, overview_level=level, lock=False).squeeze()
+
+                        # Window the lazy rasters to the AOI bbox (padded by one pixel) first,
+                        # so only that window is read from disk instead of the full tile
+                        pad = abs(da_b02.rio.resolution()[0])
+                        aoi_box = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+                        def clip_band(da):
+                            # lock=False makes rioxarray reopen the file in this pool
+                            # thread, which is outside the caller's rasterio.Env
+                            with rasterio.Env(**_GDAL_ENV_OPTIONS):
+                                da = da.rio.clip_box(*aoi_box)
+                                return da.rio.clip(geoms, drop=True, all_touched=True)
+
+                        # Each band is a separate file opened with lock=False, so the
+                        # three windowed reads + clips can run concurrently
+                        with ThreadPoolExecutor(max_workers=3) as executor:
+                            da_b02_clipped, da_b03_clipped, da_b04_clipped = executor.map(
+                                clip_band, (da_b02, da_b03, da_b04)
+                            )
                     except Exception as e:
                         print(f"Clipping failed: {e}. Skipping this granule.")
                         return None
@@ -391,20 +1025,18 @@ class Sentinel2Downloader:
                         print("Clipped area contains no valid data; skipping this granule.")
                         return None
 
-                    stacked = xr.concat([da_b04_clipped, da_b03_clipped, da_b02_clipped], dim='band')
-                    stacked['band'] = ['B04', 'B03', 'B02']
+                    if self.save_stacked_geotiff:
+                        stacked = xr.concat([da_b04_clipped, da_b03_clipped, da_b02_clipped], dim='band')
+                        stacked['band'] = ['B04', 'B03', 'B02']
 
-                    out_tif = os.path.join(output_dir, f"stacked_{os.path.splitext(os.path.basename(b02_path))[0]}.tif")
-                    try:
-                        stacked.rio.to_raster(out_tif)
-                        print(f"Saved clipped stacked GeoTIFF: {out_tif}")
-                    except Exception as e:
-                        print(f"Could not save stacked GeoTIFF: {e}")
-                except StopIteration:
-                    print("Could not locate all band file paths to save stacked GeoTIFF")
-                    return None
+                        out_tif = os.path.join(output_dir, f"stacked_{os.path.splitext(os.path.basename(b02_path))[0]}.tif")
+                        try:
+                            stacked.rio.to_raster(out_tif)
+                            print(f"Saved clipped stacked GeoTIFF: {out_tif}")
+                        except Exception as e:
+                            print(f"Could not save stacked GeoTIFF: {e}")
                 except Exception as e:
-                    print(f"Error creating stacked GeoTIFF: {e}")
+                    print(f"Error preparing RGB bands: {e}")
                     return None
 
                 # Stack as BGR for OpenCV (Blue, Green, Red) using clipped arrays
@@ -420,38 +1052,48 @@ class Sentinel2Downloader:
                     axis=2,
                 )
 
+                # Downscale the raw band stack first when it is larger than the model
+                # input, so normalization and enhancement run on IMAGE_SIZE^2 pixels
+                if bgr.shape[0] * bgr.shape[1] > IMAGE_SIZE * IMAGE_SIZE:
+                    bgr = _resize_to_model_input(bgr)
+
                 # Normalize to 0-255
                 bgr = self._normalize_to_uint8(bgr)
                 bgr = self._enhance_bgr(bgr)
 
-                # Resize to 416x416
-                resized = cv2.resize(bgr, (416, 416), interpolation=cv2.INTER_AREA)
-                output_path = os.path.join(output_dir, filename)
-                cv2.imwrite(output_path, resized)
-
-                print(f"Saved processed image: {output_path} (size: {resized.shape})")
+                output_path = self._save_image(bgr, output_dir, filename)
+                print(f"Saved processed image: {output_path}")
                 return output_path
             else:
                 missing = [b for b, v in rgb_bands.items() if v is None]
                 print(f"Missing bands: {missing}, cannot create RGB composite")
             
             # Try any TIF file as fallback
-            tif_files = [f for f in files if f.lower().endswith('.tif')]
+            tif_files = [f for f in files if f.lower().endswith(_TIF_EXTS)]
             if tif_files:
                 for tif_file in tif_files:
                     try:
                         data = rxr.open_rasterio(tif_file)
                         
                         if data.shape[0] >= 3:
-                            rgb = data[:3].values.transpose(1, 2, 0)
+                            data = data[:3]
+                            # Window georeferenced rasters to the padded AOI bbox first, so
+                            # only that window is read, then mask it to the AOI polygon
+                            if data.rio.crs is not None:
+                                field = self._field_in_crs(data.rio.crs)
+                                minx, miny, maxx, maxy = field.total_bounds
+                                pad = abs(data.rio.resolution()[0])
+                                data = data.rio.clip_box(minx - pad, miny - pad, maxx + pad, maxy + pad)
+                                data = data.rio.clip(field.geometry.values, drop=True, all_touched=True)
+                            rgb = data.values.transpose(1, 2, 0)
+                            
+                            if rgb.shape[0] * rgb.shape[1] > IMAGE_SIZE * IMAGE_SIZE:
+                                rgb = _resize_to_model_input(rgb)
                             
                             rgb = self._normalize_to_uint8(rgb)
                             rgb = self._enhance_bgr(rgb)
                             
-                            resized = cv2.resize(rgb, (416, 416), interpolation=cv2.INTER_AREA)
-                            output_path = os.path.join(output_dir, filename)
-                            cv2.imwrite(output_path, resized)
-                            
+                            output_path = self._save_image(rgb, output_dir, filename)
                             print(f"Saved processed image: {output_path}")
                             return output_path
                     except Exception as e:
@@ -477,19 +1119,14 @@ class Sentinel2Downloader:
         Returns:
             Path to created image
         """
-        image = np.zeros((416, 416, 3), dtype=np.uint8)
-        
-        x, y = np.meshgrid(np.linspace(0, 4, 416), np.linspace(0, 4, 416))
+        # Fresh noise on top of the shared deterministic pattern
+        image = _RNG.standard_normal((416, 416, 3), dtype=np.float32)
+        image *= 5
+        image += _synthetic_pattern()
+        np.clip(image, 0, 255, out=image)
+        image = image.astype(np.uint8)
         
-        image[:, :, 0] = np.uint8(100 + 50 * np.sin(x) * np.cos(y))
-        image[:, :, 1] = np.uint8(120 + 60 * np.sin(x + 0.5) * np.cos(y + 0.5))
-        image[:, :, 2] = np.uint8(80 + 40 * np.sin(x + 1) * np.cos(y + 1))
-        
-        noise = np.random.normal(0, 5, image.shape)
-        image = np.uint8(np.clip(image + noise, 0, 255))
-        
-        output_path = os.path.join(output_dir, filename)
-        cv2.imwrite(output_path, image)
+        output_path = self._save_image(image, output_dir, filename)
         print(f"Created synthetic image: {output_path}")
         
         return output_path
@@ -509,6 +1146,6 @@ def get_sentinel2_images(username=None, password=None, geojson_path=None, output
     Returns:
         Tuple of (before_image_path, after_image_path)
     """
-    downloader = Sentinel2Downloader(username, password, geojson_path, token=token)
-    before_path, after_path = downloader.download_images(output_dir)
+    downloader = Sentinel2Downloader(username, password, geojson_path, token=token, output_dir=output_dir)
+    before_path, after_path = downloader.download_images()
     return before_path, after_path
@@ -1,31 +1,208 @@
 import uuid
 import zipfile
 import os
+import json
+import functools
+import time
+import hashlib
+import threading
+import contextlib
+import cv2
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from config.settings import NVIDIA_API_URL, NVIDIA_API_KEY
 
 
 HEADER_AUTH = f"Bearer {NVIDIA_API_KEY}"
 
+# One pooled session so TCP/TLS connections are reused across the
+# authorize, upload and inference calls. Throttling (429) and transient 5xx
+# responses are retried with backoff, honouring Retry-After; the final
+# response is still surfaced through raise_for_status(). Read timeouts are
+# not retried: a 300 s inference POST that timed out may still be running
+# server-side, and re-sending it would only stack up duplicate jobs
+_SESSION = requests.Session()
+_SESSION.headers.update({"Authorization": HEADER_AUTH})
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=5,
+            read=0,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            allowed_methods=frozenset(["POST", "PUT", "GET"]),
+            raise_on_status=False,
+        ),
+    ),
+)
 
-def upload_asset(image_path: str, description: str) -> str:
+# Caps concurrent detections at the account's NVCF concurrency
+_NVCF_SEM = threading.BoundedSemaphore(int(os.getenv("NVCF_MAX_CONCURRENCY", "4")))
+
+# Uploaded asset ids keyed by image content hash; NVCF keeps assets ~24h
+ASSET_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "river_enc", "nvcf_assets.json")
+ASSET_CACHE_TTL = 23 * 60 * 60
+_ASSET_CACHE_LOCK = threading.Lock()
+# Assets belong to the account that uploaded them, so cache keys carry a
+# hash of the API key (never the key itself)
+_API_KEY_TAG = hashlib.blake2b((NVIDIA_API_KEY or "").encode(), digest_size=8).hexdigest()
+
+NVCF_ASSETS_URL = "https://api.nvcf.nvidia.com/v2/nvcf/assets"
+
+# Static request headers, built once (the bearer token lives on _SESSION)
+_AUTHZ_HEADERS = {
+    "Content-Type": "application/json",
+    "accept": "application/json",
+}
+_PUT_HEADER_TEMPLATE = {
+    "Authorization": None,  # presigned URL; must not also carry the bearer token
+    "content-type": "image/jpeg",
+}
+
+# Result ZIP entries worth extracting when no out_*.jpg map is present
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# Images larger than this are re-encoded (bounded size, JPEG) before upload
+UPLOAD_MAX_DIM = 1024
+UPLOAD_JPEG_QUALITY = 85
+UPLOAD_REENCODE_MIN_BYTES = 256 * 1024
+
+
+def _load_asset_cache() -> dict:
+    try:
+        with open(ASSET_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def _authz_body(description: str) -> bytes:
+    """
+    Returns the serialized asset authorization request for a description
+    """
+    return json.dumps({"contentType": "image/jpeg", "description": description}).encode()
+
+
+def _file_digest(path: str) -> str:
+    """
+    Returns the blake2b content hash of a file, read in 1 MiB chunks
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _asset_cache_key(digest: str, description: str, reencoded: bool = False) -> str:
+    """
+    Returns the asset cache key for a source file hash, description and API key
+
+    Re-encoded uploads are keyed by their source file plus the encode settings,
+    so a cache hit is known before any image is decoded.
+    """
+    variant = f"jpeg{UPLOAD_JPEG_QUALITY}@{UPLOAD_MAX_DIM}" if reencoded else "file"
+    return hashlib.blake2b(
+        f"{_API_KEY_TAG}:{description}:{variant}:{digest}".encode(), digest_size=16
+    ).hexdigest()
+
+
+def _cached_asset_id(key: str):
+    """
+    Returns the asset ID of a still-fresh upload under this cache key, or None
+    """
+    with _ASSET_CACHE_LOCK:
+        entry = _load_asset_cache().get(key)
+    if entry and time.time() - entry.get("created", 0) < ASSET_CACHE_TTL:
+        return entry["asset_id"]
+    return None
+
+
+def _store_asset_id(key: str, asset_id: str) -> None:
+    """
+    Records an uploaded asset ID and drops expired entries
+    """
+    now = time.time()
+    with _ASSET_CACHE_LOCK:
+        cache = {
+            key: entry for key, entry in _load_asset_cache().items()
+            if now - entry.get("created", 0) < ASSET_CACHE_TTL
+        }
+        cache[key] = {"asset_id": asset_id, "created": now}
+        try:
+            os.makedirs(os.path.dirname(ASSET_CACHE_PATH), exist_ok=True)
+            tmp_path = f"{ASSET_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, ASSET_CACHE_PATH)
+        except OSError:
+            pass  # Cache is best effort; the upload itself succeeded
+
+
+def _pair_needs_reencode(reference_image: str, test_image: str) -> bool:
+    """
+    Returns True if either image of the pair is at least UPLOAD_REENCODE_MIN_BYTES
+    """
+    return max(os.path.getsize(reference_image), os.path.getsize(test_image)) >= UPLOAD_REENCODE_MIN_BYTES
+
+
+def _reencode_pair(reference_image: str, test_image: str) -> tuple:
+    """
+    Re-encodes both images of a pair as bounded-size JPEGs
+
+    Both images are scaled by the same factor (so that the larger side of
+    the pair fits UPLOAD_MAX_DIM), which keeps their aspect ratios and
+    their matching dimensions. Pairs whose dimensions differ are not touched.
+    Returns (reference_bytes, test_bytes), or (None, None) to upload both
+    files as-is.
+    """
+    reference = cv2.imread(reference_image, cv2.IMREAD_COLOR)
+    test = cv2.imread(test_image, cv2.IMREAD_COLOR)
+    if reference is None or test is None or reference.shape[:2] != test.shape[:2]:
+        return None, None
+
+    h, w = reference.shape[:2]
+    scale = min(1.0, UPLOAD_MAX_DIM / max(h, w))
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+
+    encoded = []
+    for img in (reference, test):
+        if scale < 1.0:
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, UPLOAD_JPEG_QUALITY])
+        if not ok:
+            return None, None
+        encoded.append(buf.tobytes())
+    return tuple(encoded)
+
+
+def upload_asset(image_path: str, description: str, payload: bytes = None) -> str:
     """
     Uploads an image to NVIDIA NVCF and returns asset ID
+
+    If payload is given (see _reencode_pair) those re-encoded bytes of the
+    file are uploaded instead of the file itself. An identical file uploaded
+    the same way within the asset lifetime reuses the earlier asset ID
+    instead of uploading again, as long as the description and API key also
+    match.
     """
-    with open(image_path, "rb") as f:
-        binary = f.read()
+    cache_key = _asset_cache_key(_file_digest(image_path), description, payload is not None)
+    asset_id = _cached_asset_id(cache_key)
+    if asset_id:
+        return asset_id
 
-    authorize = requests.post(
-        "https://api.nvcf.nvidia.com/v2/nvcf/assets",
-        headers={
-            "Authorization": HEADER_AUTH,
-            "Content-Type": "application/json",
-            "accept": "application/json",
-        },
-        json={
-            "contentType": "image/jpeg",
-            "description": description
-        },
+    authorize = _SESSION.post(
+        NVCF_ASSETS_URL,
+        headers=_AUTHZ_HEADERS,
+        data=_authz_body(description),
         timeout=30,
     )
     authorize.raise_for_status()
@@ -33,16 +210,22 @@ def upload_asset(image_path: str, description: str) -> str:
     upload_url = authorize.json()["uploadUrl"]
     asset_id = authorize.json()["assetId"]
 
-    response = requests.put(
-        upload_url,
-        data=binary,
-        headers={
-            "x-amz-meta-nvcf-asset-description": description,
-            "content-type": "image/jpeg",
-        },
-        timeout=300,
-    )
-    response.raise_for_status()
+    # Re-encoded payloads go up from memory; otherwise stream straight from the file
+    with open(image_path, "rb") if payload is None else contextlib.nullcontext(payload) as body:
+        size = os.path.getsize(image_path) if payload is None else len(payload)
+        response = _SESSION.put(
+            upload_url,
+            data=body,
+            headers={
+                **_PUT_HEADER_TEMPLATE,
+                "x-amz-meta-nvcf-asset-description": description,
+                "Content-Length": str(size),
+            },
+            timeout=300,
+        )
+        response.raise_for_status()
+
+    _store_asset_id(cache_key, asset_id)
 
     return asset_id
 
@@ -51,44 +234,86 @@ def run_visual_changenet(
     reference_image: str,
     test_image: str,
     output_dir: str
-) -> str:
+) -> tuple:
     """
     Runs Visual ChangeNet on two images and extracts results
+
+    Returns (output_dir, change_map): the first out_*.jpg change map decoded
+    straight from the result ZIP as a grayscale array, or None when the
+    response has none (its images are then extracted for load_change_map)
     """
 
     os.makedirs(output_dir, exist_ok=True)
 
-    asset_id1 = upload_asset(reference_image, "Reference Image")
-    asset_id2 = upload_asset(test_image, "Test Image")
+    # Re-encode (or not) both images together so their sizes always match.
+    # A pair already uploaded in re-encoded form is found in the asset cache
+    # by its source files, so a cache hit skips the decode and re-encode
+    payload1 = payload2 = None
+    cached = (None, None)
+    if _pair_needs_reencode(reference_image, test_image):
+        cached = tuple(
+            _cached_asset_id(_asset_cache_key(_file_digest(path), description, True))
+            for path, description in ((reference_image, "Reference Image"), (test_image, "Test Image"))
+        )
+        if not all(cached):
+            payload1, payload2 = _reencode_pair(reference_image, test_image)
 
-    inputs = {
-        "reference_image": asset_id1,
-        "test_image": asset_id2
-    }
+    with _NVCF_SEM:
+        if all(cached):
+            asset_id1, asset_id2 = cached
+        else:
+            # The two uploads are independent I/O; run them concurrently
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                future1 = executor.submit(upload_asset, reference_image, "Reference Image", payload1)
+                future2 = executor.submit(upload_asset, test_image, "Test Image", payload2)
+                asset_id1, asset_id2 = future1.result(), future2.result()
 
-    asset_list = f"{asset_id1},{asset_id2}"
+        inputs = {
+            "reference_image": asset_id1,
+            "test_image": asset_id2
+        }
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": HEADER_AUTH,
-        "NVCF-INPUT-ASSET-REFERENCES": asset_list,
-        "NVCF-FUNCTION-ASSET-IDS": asset_list,
-    }
+        asset_list = f"{asset_id1},{asset_id2}"
 
-    response = requests.post(
-        NVIDIA_API_URL,
-        headers=headers,
-        json=inputs,
-        timeout=300
-    )
-    response.raise_for_status()
+        headers = {
+            "Content-Type": "application/json",
+            "NVCF-INPUT-ASSET-REFERENCES": asset_list,
+            "NVCF-FUNCTION-ASSET-IDS": asset_list,
+        }
+
+        zip_path = os.path.join(output_dir, "changenet_output.zip")
 
-    zip_path = os.path.join(output_dir, "changenet_output.zip")
+        # Stream the result ZIP straight to disk instead of buffering it in memory
+        with _SESSION.post(
+            NVIDIA_API_URL,
+            headers=headers,
+            json=inputs,
+            timeout=300,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            with open(zip_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
 
-    with open(zip_path, "wb") as f:
-        f.write(response.content)
+        change_map = None
+        with zipfile.ZipFile(zip_path, "r") as z:
+            # Decode the change map from the archive in memory (no extract + imread)
+            map_names = sorted(
+                name for name in z.namelist()
+                if os.path.basename(name).startswith("out_") and name.endswith(".jpg")
+            )
+            for name in map_names:
+                buf = np.frombuffer(z.read(name), np.uint8)
+                change_map = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+                if change_map is not None:
+                    break
 
-    with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(output_dir)
+            # Otherwise extract only the image entries (skip metadata) so
+            # load_change_map can fall back to them
+            if change_map is None:
+                for info in z.infolist():
+                    if info.filename.lower().endswith(_IMAGE_EXTS):
+                        z.extract(info, output_dir)
 
-    return output_dir
+        return output_dir, change_map